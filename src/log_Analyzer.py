@@ -1,6 +1,7 @@
-import os, re, json, time, fnmatch, multiprocessing, threading, logging
+import os, io, re, json, mmap, codecs, time, queue, fnmatch, multiprocessing, threading, logging
+from collections import Counter
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Tuple
 import psutil
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s", datefmt="%H:%M:%S")
@@ -10,47 +11,230 @@ logger = logging.getLogger(__name__)
 IP_RE = re.compile(r"\b\d{1,3}(?:\.\d{1,3}){3}\b")
 LEVEL_RE = re.compile(r"\b(INFO|WARN(?:ING)?|ERROR)\b", re.I)
 DATE_DAY_RE = re.compile(r"(\d{4}-\d{2}-\d{2})")
-
-def worker_entry(state: dict, task_queue, result_queue):
-    while True:
-        chunk = task_queue.get()
-        if chunk is None:
+ERROR_RE = re.compile(r"\bERROR\b", re.I)
+# Formato habitual "{fecha} [{nivel}] {ip} {mensaje}": fecha, nivel e IP en una sola pasada
+LINE_RE = re.compile(r"(?P<date>\d{4}-\d{2}-\d{2})\s+\[(?P<lvl>INFO|WARN(?:ING)?|ERROR)\]\s+(?P<ip>\b\d{1,3}(?:\.\d{1,3}){3}\b)", re.I)
+
+# Nivel tal y como aparece en la linea -> nivel normalizado. Se rellena bajo demanda para que cada
+# variante de mayusculas/minusculas se normalice una sola vez por worker
+LEVEL_NAMES = {"INFO": "INFO", "WARN": "WARNING", "WARNING": "WARNING", "ERROR": "ERROR"}
+
+def _level_name(raw: str) -> str:
+    lvl = raw.upper()
+    if lvl.startswith("WARN"):
+        lvl = "WARNING"
+    LEVEL_NAMES[raw] = lvl
+    return lvl
+
+# Segundos sin resultados tras los que se comprueba si quedan workers vivos
+RESULT_IDLE_TIMEOUT = 5.0
+
+# Maximo de chunks agrupados en un mismo mensaje de la cola de tareas
+MAX_TASK_BATCH = 16
+# Duracion objetivo de una tarea (s): por debajo se duplica el lote de chunks, por encima se reduce a la mitad
+TASK_TIME_LOW = 0.05
+TASK_TIME_HIGH = 0.5
+# Por debajo de este tamaño total (bytes) se analiza en el proceso principal, sin arrancar workers
+SEQUENTIAL_MAX_BYTES = 4 * 1024 * 1024
+# Tareas en vuelo (enviadas y aun sin resultado) por worker: una en proceso y otra esperando en la cola
+TASKS_IN_FLIGHT_PER_WORKER = 2
+
+def _read_range(fd: int, start: int, size: int) -> bytes:
+    """Lee `size` bytes desde `start` con pread (una llamada al sistema, sin seek) si existe."""
+    parts = []
+    while size > 0:
+        if hasattr(os, "pread"):
+            data = os.pread(fd, size, start)
+        else:
+            os.lseek(fd, start, os.SEEK_SET)
+            data = os.read(fd, size)
+        if not data:
             break
-        total = 0
-        by_level = {"INFO": 0, "WARNING": 0, "ERROR": 0}
-        ips: Dict[str,int] = {}
-        errors_by_day: Dict[str,int] = {}
-
-        for line in chunk:
-            total += 1
-            if not line:
-                continue
-            m = LEVEL_RE.search(line)
-            if m:
-                lvl = m.group(1).upper()
-                if lvl.startswith("WARN"):
-                    lvl = "WARNING"
-                if lvl not in by_level:
-                    continue
-                by_level[lvl] += 1
+        parts.append(data)
+        start += len(data)
+        size -= len(data)
+    return b"".join(parts)
+
+# Codecs que fijan el orden de bytes con el BOM del inicio del archivo: (BOM little endian, BOM big endian)
+_BOM_CODECS = {"utf-16": (codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE),
+               "utf-32": (codecs.BOM_UTF32_LE, codecs.BOM_UTF32_BE)}
+
+def _file_bom(encoding: str, head: bytes) -> bytes:
+    """BOM al inicio del archivo si `encoding` lo usa para el orden de bytes (utf-16/utf-32); si no b""."""
+    for bom in _BOM_CODECS.get(codecs.lookup(encoding).name, ()):
+        if head.startswith(bom):
+            return bom
+    return b""
+
+def _newline_bytes(encoding: str, bom: bytes = b"", newline: str = "\n") -> bytes:
+    """Salto de linea codificado tal y como aparece en el archivo, sin BOM y con el orden de bytes de `bom`."""
+    name = codecs.lookup(encoding).name
+    if bom:
+        return newline.encode(name + ("-le" if bom == _BOM_CODECS[name][0] else "-be"))
+    # El primer encode de un codificador incremental emite el BOM (utf-8-sig, utf-16...): se descarta
+    enc = codecs.getincrementalencoder(encoding)()
+    enc.encode("")
+    return enc.encode(newline)
+
+def _advise_sequential(fd: int, mm: Optional[mmap.mmap] = None) -> None:
+    """Avisa al kernel de que el archivo (y su proyeccion) se leera en orden, para que adelante la lectura."""
+    if hasattr(os, "posix_fadvise"):
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        except OSError:
+            pass
+    # Las paginas de un mmap se leen por fallos de pagina: su readahead depende de madvise, no de fadvise
+    if mm is not None and hasattr(mmap, "MADV_SEQUENTIAL"):
+        try:
+            mm.madvise(mmap.MADV_SEQUENTIAL)
+        except OSError:
+            pass
 
-            im = IP_RE.search(line)
+def _proc_cpu_times(fd: int) -> Tuple[int, int]:
+    """(ocupado, total) en ticks de la linea "cpu" agregada de /proc/stat."""
+    fields = os.pread(fd, 4096, 0).split(b"\n", 1)[0].split()[1:9]
+    ticks = [int(v) for v in fields]
+    total = sum(ticks)
+    # idle + iowait cuentan como tiempo libre, igual que psutil.cpu_percent
+    return total - ticks[3] - (ticks[4] if len(ticks) > 4 else 0), total
+
+def _proc_mem_percent(fd: int) -> float:
+    """Memoria en uso (%) segun /proc/meminfo: (MemTotal - MemAvailable) / MemTotal, como psutil."""
+    info = {}
+    for line in os.pread(fd, 4096, 0).split(b"\n"):
+        key, _, rest = line.partition(b":")
+        if key in (b"MemTotal", b"MemAvailable"):
+            info[key] = int(rest.split()[0])
+            if len(info) == 2:
+                break
+    total = info[b"MemTotal"]
+    return (total - info[b"MemAvailable"]) / total * 100 if total else 0.0
+
+def _analyze_chunk(chunk: List[str]) -> Dict[str, Any]:
+    """Estadisticas parciales (lineas, niveles, IPs y errores por dia) de una lista de lineas."""
+    total = 0
+    by_level = {"INFO": 0, "WARNING": 0, "ERROR": 0}
+    # IPs y dias se acumulan en listas y se cuentan al final con Counter (bucle en C)
+    ip_list: List[str] = []
+    error_days: List[str] = []
+
+    for line in chunk:
+        total += 1
+        # Camino rapido para el formato habitual, antes de cualquier otra comprobacion:
+        # solo las lineas que no lo siguen pagan el filtro previo y las busquedas sueltas
+        fm = LINE_RE.match(line)
+        if fm:
+            day, lvl, ip = fm.groups()
+            lvl = LEVEL_NAMES.get(lvl) or _level_name(lvl)
+            by_level[lvl] += 1
+            ip_list.append(ip)
+            if lvl == "ERROR" or ("ERROR" in line.upper() and ERROR_RE.search(line)):
+                error_days.append(day)
+            continue
+
+        if not line:
+            continue
+        upper = line.upper()
+        # Filtro previo: sin nivel ni ERROR en la linea solo puede aportar la IP
+        if not ("INFO" in upper or "WARN" in upper or "ERROR" in upper):
+            # Una IPv4 necesita puntos: sin "." no hace falta lanzar la regex
+            im = IP_RE.search(line) if "." in line else None
             if im:
                 ip = im.group(0)
-                ips[ip] = ips.get(ip, 0) + 1
-
-            if re.search(r"\bERROR\b", line, re.I):
+                ip_list.append(ip)
+            continue
+
+        m = LEVEL_RE.search(line)
+        if m:
+            lvl = m.group(1)
+            lvl = LEVEL_NAMES.get(lvl) or _level_name(lvl)
+            if lvl not in by_level:
+                continue
+            by_level[lvl] += 1
+
+        im = IP_RE.search(line) if "." in line else None
+        if im:
+            ip = im.group(0)
+            ip_list.append(ip)
+
+        if "ERROR" in upper and ERROR_RE.search(line):
+            # Fecha al inicio de la linea (p.ej. "2025-01-01T10:00:00"): basta con recortarla
+            day = line[:10]
+            if not (len(day) == 10 and day[4] == "-" and day[7] == "-"
+                    and (day[:4] + day[5:7] + day[8:]).isdecimal()):
                 dm = DATE_DAY_RE.search(line)
-                if dm:
-                    day = dm.group(1)
-                    errors_by_day[day] = errors_by_day.get(day, 0) + 1
+                day = dm.group(1) if dm else None
+            if day:
+                error_days.append(day)
 
-        result_queue.put({
-            "total_lines": total,
-            "by_level": by_level,
-            "ip_counts": ips,
-            "errors_by_day": errors_by_day
-        })
+    return {
+        "total_lines": total,
+        "by_level": by_level,
+        "ip_counts": dict(Counter(ip_list)),
+        "errors_by_day": dict(Counter(error_days))
+    }
+
+def worker_entry(state: dict, task_queue, result_queue):
+    encoding = state.get("encoding", "utf-8")
+    errors = state.get("open_errors_strategy", "replace")
+    # Tabla id -> ruta, recibida una sola vez al arrancar: las tareas solo llevan el id del archivo
+    paths = state.get("files", [])
+    # Archivo actual proyectado en memoria: los chunks consecutivos de un archivo no lo reabren
+    # y todos los workers comparten las mismas paginas de la cache del sistema
+    fd_id, fd, mm, bom = None, None, None, b""
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        t0 = time.perf_counter()
+        try:
+            # Cada tarea es una lista de rangos (id de archivo, inicio, fin) en bytes: varios chunks seguidos
+            # o restos de archivos pequeños agrupados. El worker lee y decodifica sus propios rangos
+            chunk: List[str] = []
+            for file_id, start, end in task:
+                path = paths[file_id]
+                try:
+                    if file_id != fd_id:
+                        if mm is not None:
+                            mm.close()
+                        if fd is not None:
+                            os.close(fd)
+                        fd_id, fd, mm = None, None, None
+                        fd = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+                        fd_id = file_id
+                        try:
+                            mm = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+                        except (OSError, ValueError):
+                            mm = None
+                        _advise_sequential(fd, mm)
+                        bom = _file_bom(encoding, mm[:4] if mm is not None else _read_range(fd, 0, 4))
+                    data = mm[start:end] if mm is not None else _read_range(fd, start, end - start)
+                    if start and bom:
+                        # Rango a mitad de un archivo UTF-16/32: sin el BOM del archivo se decodificaria
+                        # con el orden de bytes nativo
+                        data = bom + data
+                    lines = io.StringIO(data.decode(encoding, errors), newline=None).readlines()
+                except (OSError, UnicodeError) as e:
+                    # Solo se descarta este rango: el resto de archivos agrupados en la tarea sigue adelante
+                    logger.error("Error leyendo %s [%d:%d]: %s", path, start, end, e)
+                    continue
+                chunk.extend(lines)
+            result = _analyze_chunk(chunk)
+            # Tiempo de la tarea y numero de rangos: el padre ajusta con ellos el tamaño de los lotes
+            result["elapsed"] = time.perf_counter() - t0
+            result["ranges"] = len(task)
+        except Exception as e:
+            # Red de seguridad para fallos inesperados (errores de programacion): los de lectura o
+            # decodificacion de un rango ya se tratan arriba sin perder el resto de la tarea.
+            # La traza completa queda en el log del worker; por la cola solo viaja un resumen
+            logger.exception("Error procesando tarea (%d rangos) %s", len(task), task)
+            result = {"error": f"{e.__class__.__name__}: {e}"}
+        result_queue.put(result)
+
+    if mm is not None:
+        mm.close()
+    if fd is not None:
+        os.close(fd)
 
 class LogAnalyzer:
     
@@ -63,14 +247,22 @@ class LogAnalyzer:
                  patterns: Optional[List[str]] = None,
                  open_errors_strategy: str = "replace",
                  info_dir: Optional[str] = None,
-                 output: Optional[str] = None):
+                 output: Optional[str] = None,
+                 use_threads: bool = False,
+                 detailed_monitor: bool = False,
+                 pin_workers: bool = False,
+                 sequential_max_bytes: int = SEQUENTIAL_MAX_BYTES):
         self.log_dir = log_dir
         self.lines_per_chunk = max(1, int(lines_per_chunk))
         self.workers = max(1, int(workers))
         self.encoding = encoding
         self.monitor = bool(monitor)
+        self.detailed_monitor = bool(detailed_monitor)
+        self.pin_workers = bool(pin_workers)
         self.patterns = patterns or ["*.log"]
         self.open_errors_strategy = open_errors_strategy
+        self.use_threads = bool(use_threads)
+        self.sequential_max_bytes = max(0, int(sequential_max_bytes))
         self.info_dir = info_dir or os.path.join(os.getcwd(), "info")
 
         os.makedirs(self.info_dir, exist_ok=True)
@@ -84,58 +276,198 @@ class LogAnalyzer:
         if psutil is None:
             raise RuntimeError("psutil no está instalado. Instale con: pip install psutil")
 
-        stop = {"run": True}
+        # Event en lugar de sleep: al terminar el analisis el hilo se detiene al momento,
+        # sin esperar a que acabe el intervalo en curso
+        stop = threading.Event()
 
         def _mon():
 
-            psutil.cpu_percent(interval=None)
+            # En Linux /proc/stat y /proc/meminfo se abren una vez y se releen con pread en cada muestra,
+            # sin la capa de psutil; en otros sistemas (o si fallan) se usa psutil
+            proc_fds = []
+            prev = None
+            if hasattr(os, "pread"):
+                try:
+                    for name in ("/proc/stat", "/proc/meminfo"):
+                        proc_fds.append(os.open(name, os.O_RDONLY))
+                    prev = _proc_cpu_times(proc_fds[0])
+                    _proc_mem_percent(proc_fds[1])
+                except (OSError, ValueError, IndexError, KeyError):
+                    for fd in proc_fds:
+                        os.close(fd)
+                    proc_fds, prev = [], None
+            if prev is None:
+                psutil.cpu_percent(interval=None)
 
             proc_objs = {}
-            while stop["run"]:
+            tick = 0
+            while not stop.is_set():
                 try:
-                    
-                    cpu = psutil.cpu_percent(interval=None)
-                    mem = psutil.virtual_memory().percent
+                    if prev is not None:
+                        busy, total = _proc_cpu_times(proc_fds[0])
+                        cpu = (busy - prev[0]) / (total - prev[1]) * 100 if total > prev[1] else 0.0
+                        prev = busy, total
+                        mem = _proc_mem_percent(proc_fds[1])
+                    else:
+                        cpu = psutil.cpu_percent(interval=None)
+                        mem = psutil.virtual_memory().percent
                     msg = f"MONITOR — CPU_sistema: {cpu:.1f}%  MEM_sistema: {mem:.1f}%"
-                    if worker_pids:
-                        per_proc = []
-                        for pid in worker_pids:
-                            try:
-                                p = proc_objs.get(pid) or psutil.Process(pid)
-                                proc_objs[pid] = p
-                                p_cpu = p.cpu_percent(interval=None)
-                                p_rss = p.memory_info().rss / (1024 * 1024)
-                                per_proc.append(f"PID {pid}: CPU {p_cpu:.1f}% MEM {p_rss:.1f}MB")
-                            except psutil.NoSuchProcess:
-                                per_proc.append(f"PID {pid}: terminado")
-                            except Exception:
-                                per_proc.append(f"PID {pid}: métricas no disponibles")
-                        if per_proc:
-                            msg += " — " + " | ".join(per_proc)
+                    # Metricas por proceso solo con detailed_monitor: un PID por intervalo, por turnos,
+                    # para no leer /proc de todos los workers en cada muestra
+                    if worker_pids and self.detailed_monitor:
+                        pid = worker_pids[tick % len(worker_pids)]
+                        try:
+                            p = proc_objs.get(pid) or psutil.Process(pid)
+                            proc_objs[pid] = p
+                            p_cpu = p.cpu_percent(interval=None)
+                            p_rss = p.memory_info().rss / (1024 * 1024)
+                            msg += f" — PID {pid}: CPU {p_cpu:.1f}% MEM {p_rss:.1f}MB"
+                        except psutil.NoSuchProcess:
+                            msg += f" — PID {pid}: terminado"
+                        except Exception:
+                            msg += f" — PID {pid}: métricas no disponibles"
                     logger.info(msg)
                 except Exception as e:
                     logger.exception("Error en monitor: %s", e)
-                time.sleep(interval)
+                tick += 1
+                stop.wait(interval)
+            for fd in proc_fds:
+                os.close(fd)
 
         # Creacion de un hilos para ejecutar la monitorización
         th = threading.Thread(target=_mon, daemon=True)
-        th._stop_flag = stop
+        th._stop_event = stop
         th.start()
         return th
 
+    def _task_batch_size(self, total_bytes: int, chunk_bytes: int) -> Tuple[int, int]:
+        """(inicial, maximo) de chunks por mensaje: el maximo es ~total_chunks/(workers+2), como el
+        chunksize de emcee, y el inicial no pasa de MAX_TASK_BATCH."""
+        est_chunks = total_bytes // max(1, chunk_bytes)
+        limit = max(1, est_chunks // (self.workers + 2))
+        return min(MAX_TASK_BATCH, limit), limit
+
+    @staticmethod
+    def _tune_batch(tuning: Dict[str, Any], elapsed: float, ranges: int) -> None:
+        """Ajusta tuning["batch"] segun la media movil (EWMA) del tiempo por rango, como el auto-batching de joblib."""
+        per_range = elapsed / max(1, ranges)
+        ewma = tuning.get("ewma")
+        ewma = per_range if ewma is None else 0.8 * ewma + 0.2 * per_range
+        tuning["ewma"] = ewma
+        batch = tuning.get("batch")
+        if batch is None:
+            return
+        # Duracion estimada de una tarea con el lote actual
+        est = ewma * batch
+        if est < TASK_TIME_LOW and batch < tuning["max_batch"]:
+            tuning["batch"] = min(tuning["max_batch"], batch * 2)
+        elif est > TASK_TIME_HIGH and batch > 1:
+            tuning["batch"] = batch // 2
+
+    def _list_log_files(self) -> List[Tuple[str, str, int]]:
+        """(nombre, ruta, tamaño) de los archivos de log_dir que cumplen algun patron, ordenados por nombre."""
+        # Un unico regex para todos los patrones; normcase como fnmatch.fnmatch (sin mayusculas en Windows)
+        pat_re = re.compile("|".join(fnmatch.translate(os.path.normcase(p)) for p in self.patterns))
+        found = []
+        # scandir ya conoce el tipo de cada entrada: no hace falta un stat extra por archivo
+        with os.scandir(self.log_dir) as it:
+            for e in it:
+                if not pat_re.match(os.path.normcase(e.name)):
+                    continue
+                try:
+                    if e.is_file():
+                        found.append((e.name, e.path, e.stat().st_size))
+                except OSError as ex:
+                    # Archivo rotado o borrado tras listar el directorio: se omite, como antes
+                    logger.warning("Se omite %s: %s", e.path, ex)
+        return sorted(found)
+
+    def _iter_chunk_ranges(self, path: str) -> Iterator[Tuple[int, int, int]]:
+        """Rangos (inicio, fin, lineas) en bytes de `lines_per_chunk` lineas, alineados a saltos de linea."""
+        with open(path, "rb", buffering=0) as fh:
+            size = os.fstat(fh.fileno()).st_size
+            if not size:
+                return
+            # Los saltos de linea se buscan directamente sobre el archivo proyectado, sin copiarlo
+            with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                _advise_sequential(fh.fileno(), mm)
+                # Salto de linea codificado (b"\n", o p.ej. b"\n\x00" en UTF-16-LE); si ocupa varios bytes
+                # solo cuenta en posiciones alineadas a la unidad de codigo, no a mitad de un caracter
+                bom = _file_bom(self.encoding, mm[:4])
+                nl = _newline_bytes(self.encoding, bom)
+                if mm.find(nl) < 0:
+                    # Sin ningun "\n": archivo con finales de linea "\r" (Mac clasico); se corta por "\r"
+                    cr = _newline_bytes(self.encoding, bom, "\r")
+                    if mm.find(cr) >= 0:
+                        nl = cr
+                unit = len(nl)
+                find = mm.find
+                start = pos = 0
+                lines = 0
+                while True:
+                    nxt = find(nl, pos)
+                    if nxt < 0:
+                        break
+                    if unit > 1 and nxt % unit:
+                        pos = nxt + 1
+                        continue
+                    pos = nxt + unit
+                    lines += 1
+                    if lines == self.lines_per_chunk:
+                        yield start, pos, lines
+                        start = pos
+                        lines = 0
+        if size > start:
+            yield start, size, lines + (1 if size > pos else 0)
+
     def analyze(self) -> Dict[str, Any]:
 
-        ctx = multiprocessing.get_context()
-        task_q = ctx.Queue(maxsize=self.workers * 4)
-        result_q = ctx.Queue()
+        log_files = self._list_log_files()
+        total_bytes = sum(size for _, _, size in log_files)
+        if total_bytes < self.sequential_max_bytes:
+            # Carga pequeña: arrancar workers y colas cuesta mas que analizarla directamente
+            logger.info("Carga pequeña (%d bytes): análisis secuencial en el proceso principal", total_bytes)
+            return self._analyze_sequential(log_files, total_bytes)
+
+        if self.use_threads:
+            # Workers como hilos del proceso padre: sin arranque de procesos ni serializacion de tareas.
+            # Solo escalan en CPU en CPython sin GIL: el modulo re no lo libera durante la busqueda
+            task_q = queue.Queue(maxsize=self.workers * 4)
+            result_q = queue.Queue()
+        else:
+            ctx = multiprocessing.get_context()
+            # SimpleQueue para las tareas: escribe directamente en la tuberia, sin hilo alimentador.
+            # No tiene maxsize: el limite de tareas en vuelo lo pone el semaforo `inflight` de abajo.
+            # Los resultados siguen en Queue porque get(timeout) permite vigilar a los workers
+            task_q = ctx.SimpleQueue()
+            result_q = ctx.Queue()
         workers = []
-        state = {"encoding": self.encoding, "open_errors_strategy": self.open_errors_strategy}
+        state = self._worker_state(log_files)
+        if hasattr(os, "sched_getaffinity"):
+            cpus = sorted(os.sched_getaffinity(0))
+        else:
+            cpus = list(range(psutil.cpu_count() or 1))
 
         for i in range(self.workers):
+            if self.use_threads:
+                t = threading.Thread(target=worker_entry, args=(state, task_q, result_q), daemon=True)
+                t.start()
+                workers.append(t)
+                logger.info("Worker %d (hilo %s)", i+1, t.name)
+                continue
+
             p = ctx.Process(target=worker_entry, args=(state, task_q, result_q))
             p.start()
             workers.append(p)
 
+            if self.pin_workers:
+                # Cada worker fijo en una CPU (por turnos) para que no migre y conserve sus caches
+                cpu = cpus[i % len(cpus)]
+                try:
+                    psutil.Process(p.pid).cpu_affinity([cpu])
+                except (AttributeError, psutil.Error, OSError) as e:
+                    logger.warning("Worker %d (PID %d) — no se pudo fijar a la CPU %d: %s", i+1, p.pid, cpu, e)
+
             try:
                 rss = psutil.Process(p.pid).memory_info().rss / (1024 * 1024) if psutil else None
             except Exception:
@@ -161,87 +493,150 @@ class LogAnalyzer:
             if psutil is None:
 
                 raise RuntimeError("Psutil no disponible. Instale psutil: pip install psutil")
-            worker_pids = [p.pid for p in workers if p.pid is not None]
+            if self.use_threads:
+                worker_pids = [os.getpid()]
+            else:
+                worker_pids = [p.pid for p in workers if p.pid is not None]
             mon_thread = self._start_monitor(worker_pids, 1.0)
 
-        files = 0
-        chunks_sent = 0
-        for fname in sorted(os.listdir(self.log_dir)):
-            if not any(fnmatch.fnmatch(fname, pat) for pat in self.patterns):
-                continue
-            path = os.path.join(self.log_dir, fname)
-            if not os.path.isfile(path):
-                continue
-            files += 1
-            try:
-                with open(path, "r", encoding=self.encoding, errors=self.open_errors_strategy) as fh:
-                    buf: List[str] = []
-                    for line in fh:
-                        buf.append(line)
-                        if len(buf) >= self.lines_per_chunk:
-                            task_q.put(buf)
-                            chunks_sent += 1
-                            if chunks_sent % 100 == 0:
-                                logger.info("Chunks enviados=%d (archivo=%s)", chunks_sent, fname)
-                            buf = []
-                    if buf:
-                        task_q.put(buf)
-                        chunks_sent += 1
-            except Exception as e:
-                logger.exception("Error leyendo %s: %s", path, e)
-
-        logger.info("Productor finalizado: archivos=%d, chunks=%d", files, chunks_sent)
-        for _ in workers:
-            task_q.put(None)
-
-        partials: List[Dict[str,Any]] = []
-        import queue as _q
-        alive = len(workers)
-        while alive > 0:
-            try:
-                part = result_q.get(timeout=1.0)
-                partials.append(part)
-            except _q.Empty:
-                alive = sum(1 for p in workers if p.is_alive())
-
-        try:
-            while True:
-                partials.append(result_q.get_nowait())
-        except Exception:
-            pass
+        # El productor corre en su propio hilo: los resultados se fusionan mientras se siguen
+        # enviando tareas, en lugar de acumularse en las colas hasta que termine el reparto
+        # tuning lo comparten productor y colector: el tamaño de lote se adapta mientras se reparte
+        tuning: Dict[str, Any] = {"batch": None, "max_batch": 1, "ewma": None}
+        # El productor toma un permiso por tarea y el colector lo devuelve con cada resultado: asi nunca hay
+        # mas de unas pocas tareas por worker pendientes y los cambios de lote se aplican enseguida
+        inflight = threading.BoundedSemaphore(len(workers) * TASKS_IN_FLIGHT_PER_WORKER)
+        producer = threading.Thread(target=self._produce,
+                                    args=(log_files, total_bytes, task_q, result_q, len(workers), tuning, inflight),
+                                    daemon=True)
+        producer.start()
+
+        # Los resultados se fusionan a medida que llegan, sin guardar la lista de parciales
+        acc = self._merge(self._iter_results(result_q, workers, tuning, inflight))
+        producer.join(timeout=1.0)
 
         for p in workers:
             p.join(timeout=2.0)
 
         if mon_thread:
-            mon_thread._stop_flag["run"] = False
+            mon_thread._stop_event.set()
             mon_thread.join(timeout=1.0)
 
-        return self._merge(partials)
+        return acc
+
+    def _worker_state(self, log_files: List[Tuple[str, str, int]]) -> Dict[str, Any]:
+        """Configuracion que recibe cada worker al arrancar, con la tabla de rutas indexada por id de archivo."""
+        return {"encoding": self.encoding, "open_errors_strategy": self.open_errors_strategy,
+                "files": [path for _, path, _ in log_files]}
+
+    def _analyze_sequential(self, log_files: List[Tuple[str, str, int]], total_bytes: int) -> Dict[str, Any]:
+        """Productor, worker y fusion uno tras otro en el proceso principal, con colas locales."""
+        task_q, result_q = queue.Queue(), queue.Queue()
+        state = self._worker_state(log_files)
+        self._produce(log_files, total_bytes, task_q, result_q, 1)
+        worker_entry(state, task_q, result_q)
+        return self._merge(self._iter_results(result_q, []))
+
+    def _produce(self, log_files: List[Tuple[str, str, int]], total_bytes: int, task_q, result_q, n_workers: int,
+                 tuning: Optional[Dict[str, Any]] = None,
+                 inflight: Optional[threading.BoundedSemaphore] = None) -> None:
+        """Envia las tareas de todos los archivos, un None por worker y, al final, el total de tareas enviadas."""
+        files = 0
+        chunks = 0
+        # Cada tarea puede agrupar varios chunks: se cuentan por separado
+        tasks_sent = 0
+        try:
+            tuning = {} if tuning is None else tuning
+            # Rangos pendientes de enviar: restos de archivos pequeños y, una vez estimado el lote,
+            # varios chunks seguidos por mensaje para repartir el coste de la cola entre mas lineas
+            pending: List[Tuple[int, int, int]] = []
+            pending_lines = 0
+            for file_id, (fname, path, _) in enumerate(log_files):
+                files += 1
+                try:
+                    for start, end, lines in self._iter_chunk_ranges(path):
+                        if tuning.get("batch") is None and lines >= self.lines_per_chunk:
+                            tuning["batch"], tuning["max_batch"] = self._task_batch_size(total_bytes, end - start)
+                        pending.append((file_id, start, end))
+                        pending_lines += lines
+                        chunks += 1
+                        if pending_lines < self.lines_per_chunk * (tuning.get("batch") or 1):
+                            continue
+                        if inflight is not None:
+                            inflight.acquire()
+                        task_q.put(pending)
+                        pending, pending_lines = [], 0
+                        tasks_sent += 1
+                        if tasks_sent % 100 == 0:
+                            logger.info("Tareas enviadas=%d, chunks=%d (archivo=%s)", tasks_sent, chunks, fname)
+                except Exception as e:
+                    logger.exception("Error leyendo %s: %s", path, e)
+            if pending:
+                if inflight is not None:
+                    inflight.acquire()
+                task_q.put(pending)
+                tasks_sent += 1
+        except Exception as e:
+            logger.exception("Error en el productor: %s", e)
+        finally:
+            logger.info("Productor finalizado: archivos=%d, chunks=%d, tareas=%d", files, chunks, tasks_sent)
+            for _ in range(n_workers):
+                task_q.put(None)
+            # Marca de fin por la cola de resultados: el colector sabe cuantos resultados esperar
+            result_q.put({"tasks_sent": tasks_sent})
+
+    @staticmethod
+    def _iter_results(result_q, workers, tuning: Optional[Dict[str, Any]] = None,
+                      inflight: Optional[threading.BoundedSemaphore] = None) -> Iterator[Dict[str,Any]]:
+        """Genera los resultados parciales (uno por tarea) hasta recibir todos los que anuncia el productor."""
+        received = 0
+        expected = None
+        while expected is None or received < expected:
+            try:
+                part = result_q.get(timeout=RESULT_IDLE_TIMEOUT)
+            except queue.Empty:
+                # Sin resultados durante un rato: solo se comprueba que algun worker siga vivo
+                if not any(p.is_alive() for p in workers):
+                    logger.error("Workers finalizados con %s resultados pendientes",
+                                 expected - received if expected is not None else "varios")
+                    return
+                continue
+            if "tasks_sent" in part:
+                expected = part["tasks_sent"]
+                continue
+            received += 1
+            if inflight is not None:
+                inflight.release()
+            if "error" in part:
+                logger.error("Tarea fallida en un worker: %s", part["error"])
+                continue
+            if tuning is not None and "elapsed" in part:
+                LogAnalyzer._tune_batch(tuning, part["elapsed"], part.get("ranges", 1))
+            yield part
 
-    def _merge(self, parts: List[Dict[str,Any]]) -> Dict[str,Any]:
+    def _merge(self, parts: Iterable[Dict[str,Any]]) -> Dict[str,Any]:
         total = 0
         levels = {"INFO": 0, "WARNING": 0, "ERROR": 0}
-        ips: Dict[str,int] = {}
-        errors_by_day: Dict[str,int] = {}
+        # Acumuladores Counter durante la fusion; se convierten a dict solo para el resultado final
+        ips: Counter = Counter()
+        errors_by_day: Counter = Counter()
 
         for p in parts:
             total += p.get("total_lines", 0)
             for k in levels.keys():
                 levels[k] += p.get("by_level", {}).get(k, 0)
-            for ip, c in p.get("ip_counts", {}).items():
-                ips[ip] = ips.get(ip, 0) + c
-            for d, c in p.get("errors_by_day", {}).items():
-                errors_by_day[d] = errors_by_day.get(d, 0) + c
+            ips.update(p.get("ip_counts", {}))
+            errors_by_day.update(p.get("errors_by_day", {}))
 
-        top_ips = [{"ip": ip, "count": cnt} for ip, cnt in sorted(ips.items(), key=lambda x: x[1], reverse=True)[:10]]
+        # most_common(n) usa heapq.nlargest: O(U log n) en lugar de ordenar todas las IPs
+        top_ips = [{"ip": ip, "count": cnt} for ip, cnt in ips.most_common(10)]
 
         return {
             "lines_total": total,
             "by_level": levels,
             "top_10_ips": top_ips,
-            "ip_counts": ips,
-            "errors_by_day": errors_by_day
+            "ip_counts": dict(ips),
+            "errors_by_day": dict(errors_by_day)
         }
     
     @staticmethod
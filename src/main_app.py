@@ -21,17 +21,25 @@ class MainApp:
         lines_per_chunk = 100                                                
         workers =4                                                          
         monitor = True                                                       
+        detailed_monitor = False                                             
         patterns = ["*.log"]                                                 
         output = os.path.join(info_dir, "resultado.json")                   
+        use_threads = False                                                  
+        pin_workers = False                                                  
+        sequential_max_bytes = 4 * 1024 * 1024                               
 
         cfg_dict = {
             "log_dir": log_dir,
             "lines_per_chunk": lines_per_chunk,
             "workers": workers,
             "monitor": monitor,
+            "detailed_monitor": detailed_monitor,
             "patterns": patterns,
             "info_dir": info_dir,
-            "output": output
+            "output": output,
+            "use_threads": use_threads,
+            "pin_workers": pin_workers,
+            "sequential_max_bytes": sequential_max_bytes
         }
         logger.info("Configuración: %s", cfg_dict)
 
@@ -42,9 +50,13 @@ class MainApp:
                 lines_per_chunk=lines_per_chunk,
                 workers=workers,
                 monitor=monitor,
+                detailed_monitor=detailed_monitor,
                 patterns=patterns,
                 info_dir=info_dir,
-                output=output
+                output=output,
+                use_threads=use_threads,
+                pin_workers=pin_workers,
+                sequential_max_bytes=sequential_max_bytes
             )
         except FileNotFoundError as e:
             logger.error(e)